@@ -4,9 +4,50 @@ I2C interface — reads pressure + temperature
 Resolution: 0.2 mbar (~2mm water depth)
 """
 
+import atexit
+import threading
 import smbus2
+from smbus2 import i2c_msg
 import time
 
+try:
+    from numba import njit
+except ImportError:  # Pure-Python fallback — same math, just slower
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+
+@njit(cache=True)
+def _compensate(D1, D2, Tref, SENSref, OFFref, C3, C4, C6):
+    """
+    Apply calibration coefficients per MS5837-30BA datasheet.
+    Tref/SENSref/OFFref are C5*2^8, C1*2^16 and C2*2^17, precomputed once.
+    Returns (pressure_mbar, temperature_c). Under Numba all arguments are
+    int64; every intermediate fits in 64 bits for valid sensor data.
+    """
+    # First order compensation (>> is floor division by a power of two)
+    dT = D2 - Tref
+    SENS = SENSref + ((C3 * dT) >> 7)
+    OFF = OFFref + ((C4 * dT) >> 6)
+    
+    Ti = 2000 + (dT * C6) // 8388608
+    
+    # Second order compensation, branchless: terms are masked to zero
+    # unless Ti < 2000 (low temp), so the JIT can emit a select/cmov
+    low = 1 if Ti < 2000 else 0
+    dTi = Ti - 2000
+    T2 = low * ((11 * dT * dT) >> 35)
+    OFF2 = low * ((31 * dTi * dTi) >> 3)
+    SENS2 = low * ((63 * dTi * dTi) >> 5)
+    
+    OFF -= OFF2
+    SENS -= SENS2
+    
+    pressure_mbar = ((D1 * SENS // 2097152) - OFF) / 32768.0 / 100.0
+    temperature_c = Ti / 100.0 - T2 / 100.0
+    return pressure_mbar, temperature_c
+
+
 class MS5837:
     """Driver for MS5837-30BA waterproof pressure sensor."""
     
@@ -18,6 +59,7 @@ class MS5837:
     CMD_ADC_READ = 0x00
     CMD_CONVERT_D1_8192 = 0x4A  # Pressure, OSR=8192 (highest precision)
     CMD_CONVERT_D2_8192 = 0x5A  # Temperature, OSR=8192
+    CONVERSION_TIME_SEC = 0.0181  # Datasheet max conversion time at OSR 8192
     
     # Fluid densities (kg/m³)
     DENSITY_FRESHWATER = 997.0
@@ -25,91 +67,154 @@ class MS5837:
     
     def __init__(self, bus_num=1):
         self.bus = smbus2.SMBus(bus_num)
+        atexit.register(self.bus.close)  # Don't leak the i2c-dev fd
+        # Held for a whole convert → wait → read sequence so another thread
+        # can't slip a command in mid-conversion
+        self._lock = threading.Lock()
         self.C = [0] * 8  # Calibration coefficients
         self.D1 = 0  # Raw pressure
         self.D2 = 0  # Raw temperature
         self.pressure_mbar = 0.0
         self.temperature_c = 0.0
-        self.fluid_density = self.DENSITY_FRESHWATER
+        self.fluid_density = self.DENSITY_FRESHWATER  # Also sets _depth_scale/_depth_mm
+        self._d2_started = None  # Start time of a D2 conversion still in flight
+        
+        # Per-sample I2C messages, built once and reused every read
+        self._msg_conv_d1 = i2c_msg.write(self.ADDR, [self.CMD_CONVERT_D1_8192])
+        self._msg_conv_d2 = i2c_msg.write(self.ADDR, [self.CMD_CONVERT_D2_8192])
+        self._msg_adc_write = i2c_msg.write(self.ADDR, [self.CMD_ADC_READ])
+        self._msg_adc_read = i2c_msg.read(self.ADDR, 3)
         self._initialize()
+        
+        # Warm up the JIT so the first real read() isn't penalized
+        _compensate(0, 0, self._Tref, self._SENSref, self._OFFref, self.C[3], self.C[4], self.C[6])
     
     def _initialize(self):
         """Reset sensor and read calibration PROM."""
-        # Reset
-        self.bus.write_byte(self.ADDR, self.CMD_RESET)
-        time.sleep(0.01)
-        
-        # Read 7 calibration values from PROM
-        for i in range(7):
-            data = self.bus.read_i2c_block_data(self.ADDR, self.CMD_PROM_READ + (i * 2), 2)
-            self.C[i] = (data[0] << 8) | data[1]
+        with self._lock:
+            # Reset
+            self.bus.write_byte(self.ADDR, self.CMD_RESET)
+            time.sleep(0.01)
+            
+            # Read 7 calibration values from PROM
+            for i in range(7):
+                data = self._read_register(self.CMD_PROM_READ + (i * 2), 2)
+                self.C[i] = int.from_bytes(data, "big")
         
         # Verify CRC (simplified — production code should validate)
         print(f"[MS5837] Initialized. Calibration: {self.C[1:7]}")
+        
+        # Calibration is fixed after init — precompute the scaled references
+        self._Tref = self.C[5] << 8
+        self._SENSref = self.C[1] << 16
+        self._OFFref = self.C[2] << 17
+    
+    def _read_register(self, reg, n):
+        """Write a register/command byte and read n bytes back in one transaction."""
+        w = i2c_msg.write(self.ADDR, [reg])
+        r = i2c_msg.read(self.ADDR, n)
+        self.bus.i2c_rdwr(w, r)  # Repeated START, no STOP in between
+        return bytes(r)
+    
+    def _wait_conversion(self, t_start):
+        """Sleep only for whatever is left of the ADC conversion started at t_start."""
+        remaining = self.CONVERSION_TIME_SEC - (time.monotonic() - t_start)
+        if remaining > 0:
+            time.sleep(remaining)
+    
+    def _start_conversion(self, msg):
+        """Kick off an ADC conversion. Returns its monotonic start time."""
+        self.bus.i2c_rdwr(msg)
+        return time.monotonic()
+    
+    def _read_adc(self):
+        """Read the 24-bit result of the last conversion."""
+        self.bus.i2c_rdwr(self._msg_adc_write, self._msg_adc_read)
+        return int.from_bytes(bytes(self._msg_adc_read), "big")
     
     def read(self):
         """Take a pressure + temperature reading. Returns True on success."""
         try:
-            # Request D1 (pressure) conversion
-            self.bus.write_byte(self.ADDR, self.CMD_CONVERT_D1_8192)
-            time.sleep(0.02)  # Wait for conversion at OSR 8192
-            
-            # Read D1
-            data = self.bus.read_i2c_block_data(self.ADDR, self.CMD_ADC_READ, 3)
-            self.D1 = (data[0] << 16) | (data[1] << 8) | data[2]
+            with self._lock:
+                # Let any conversion left running by read_overlapped() finish
+                if self._d2_started is not None:
+                    self._wait_conversion(self._d2_started)
+                    self._d2_started = None
             
-            # Request D2 (temperature) conversion
-            self.bus.write_byte(self.ADDR, self.CMD_CONVERT_D2_8192)
-            time.sleep(0.02)
+                # Request D1 (pressure) conversion, then read it
+                self._wait_conversion(self._start_conversion(self._msg_conv_d1))
+                self.D1 = self._read_adc()
+                
+                # Request D2 (temperature) conversion, then read it
+                self._wait_conversion(self._start_conversion(self._msg_conv_d2))
+                self.D2 = self._read_adc()
+                
+                # Calculate compensated values (from MS5837-30BA datasheet)
+                self._calculate()
+                return True
             
-            # Read D2
-            data = self.bus.read_i2c_block_data(self.ADDR, self.CMD_ADC_READ, 3)
-            self.D2 = (data[0] << 16) | (data[1] << 8) | data[2]
-            
-            # Calculate compensated values (from MS5837-30BA datasheet)
-            self._calculate()
-            return True
+        except Exception as e:
+            print(f"[MS5837] Read error: {e}")
+            return False
+    
+    def read_overlapped(self):
+        """
+        Like read(), but for a loop that sleeps between calls: the D2
+        (temperature) conversion is started at the end of each call and
+        finishes during the caller's sleep, so only the D1 wait remains
+        per sample. Temperature lags pressure by one call, which is fine
+        for pool water. Returns True on success.
+        """
+        try:
+            with self._lock:
+                if self._d2_started is None:
+                    # First call (or after an error) — nothing pending yet
+                    self._d2_started = self._start_conversion(self._msg_conv_d2)
+                self._wait_conversion(self._d2_started)  # Normally already elapsed
+                self._d2_started = None
+                self.D2 = self._read_adc()
+                
+                self._wait_conversion(self._start_conversion(self._msg_conv_d1))
+                self.D1 = self._read_adc()
+                
+                # Start the next D2 now; it converts while the caller sleeps
+                self._d2_started = self._start_conversion(self._msg_conv_d2)
+                
+                self._calculate()
+                return True
             
         except Exception as e:
+            self._d2_started = None
             print(f"[MS5837] Read error: {e}")
             return False
     
     def _calculate(self):
         """Apply calibration coefficients per MS5837-30BA datasheet."""
         C = self.C
-        
-        # First order compensation
-        dT = self.D2 - C[5] * 256
-        SENS = C[1] * 65536 + (C[3] * dT) // 128
-        OFF = C[2] * 131072 + (C[4] * dT) // 64
-        
-        self.temperature_c = (2000 + (dT * C[6]) // 8388608) / 100.0
-        
-        # Second order compensation
-        T2 = 0
-        OFF2 = 0
-        SENS2 = 0
-        
-        Ti = (2000 + (dT * C[6]) // 8388608)
-        
-        if Ti < 2000:  # Low temp compensation
-            T2 = 11 * (dT * dT) // 34359738368
-            OFF2 = 31 * (Ti - 2000) ** 2 // 8
-            SENS2 = 63 * (Ti - 2000) ** 2 // 32
-        
-        OFF -= OFF2
-        SENS -= SENS2
-        
-        self.pressure_mbar = ((self.D1 * SENS // 2097152) - OFF) / 32768.0 / 100.0
-        self.temperature_c -= T2 / 100.0
+        self.pressure_mbar, self.temperature_c = _compensate(
+            self.D1, self.D2, self._Tref, self._SENSref, self._OFFref, C[3], C[4], C[6])
+        self._depth_mm = self._to_depth_mm(self.pressure_mbar)
     
-    def depth_mm(self):
-        """Convert pressure to water depth in mm."""
+    @property
+    def fluid_density(self):
+        return self._fluid_density
+    
+    @fluid_density.setter
+    def fluid_density(self, density):
+        """Set fluid density (kg/m³) and refresh the precomputed depth scale."""
+        self._fluid_density = density
+        # mbar → Pa (×100), Pa → m (÷ρg), m → mm (×1000)
+        self._depth_scale = 100.0 * 1000.0 / (density * 9.80665)
+        self._depth_mm = self._to_depth_mm(self.pressure_mbar)
+    
+    def _to_depth_mm(self, pressure_mbar):
         # Subtract atmospheric pressure (~1013.25 mbar at sea level)
         # In practice, we calibrate against the first reading
-        water_pressure_pa = (self.pressure_mbar - 1013.25) * 100.0
-        depth_m = water_pressure_pa / (self.fluid_density * 9.80665)
-        return depth_m * 1000.0  # Convert to mm
+        return (pressure_mbar - 1013.25) * self._depth_scale
+    
+    def depth_mm(self):
+        """Water depth in mm, computed once per reading in _calculate()."""
+        return self._depth_mm
     
     def pressure(self):
         """Return pressure in mbar."""
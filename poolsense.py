@@ -4,15 +4,18 @@ Main application: reads sensors, runs leak algorithm, serves web dashboard.
 """
 
 import time
-import json
 import threading
-import statistics
 import os
 from datetime import datetime, timedelta
-from collections import deque
+
+import numpy as np
+import orjson
 
 # Flask for web dashboard
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, jsonify, render_template_string
+
+# Threaded WSGI server — several dashboards can poll concurrently
+from waitress import serve
 
 # Our sensor driver
 from ms5837 import MS5837
@@ -29,33 +32,108 @@ CONFIG = {
 }
 
 # ─── Data Storage ─────────────────────────────────────────────────────
+def _median(values):
+    """Median of a small array via QuickSelect (np.partition) — O(k), no full sort."""
+    k = len(values)
+    mid = k // 2
+    if k % 2:
+        return float(np.partition(values, mid)[mid])
+    part = np.partition(values, (mid - 1, mid))
+    return (float(part[mid - 1]) + float(part[mid])) / 2.0
+
+
 class TestSession:
     """Stores all data for a single leak test."""
     
+    MAX_READINGS = 86400  # Max 24hrs of 1s readings
+    
     def __init__(self):
         self.start_time = None
-        self.readings = deque(maxlen=86400)  # Max 24hrs of 1s readings
+        # Ring buffers, one array per field (t, pressure, temp, depth)
+        self._t = np.empty(self.MAX_READINGS, np.float64)
+        self._p = np.empty(self.MAX_READINGS, np.float32)
+        self._temp = np.empty(self.MAX_READINGS, np.float32)
+        self._d = np.empty(self.MAX_READINGS, np.float32)
+        self._head = 0   # Next write index
+        self._count = 0  # Number of valid readings
+        self._leak_cache = (None, None)  # (newest timestamp, leak result)
         self.baseline_pressure = None
         self.baseline_temp = None
         self.status = "idle"  # idle, baseline, testing, complete
         self.result = None
     
     def add_reading(self, timestamp, pressure_mbar, temp_c, depth_mm):
-        self.readings.append({
-            "t": timestamp,
-            "p": round(pressure_mbar, 3),
-            "temp": round(temp_c, 2),
-            "d": round(depth_mm, 2),
-        })
+        i = self._head
+        self._t[i] = timestamp
+        self._p[i] = pressure_mbar
+        self._temp[i] = temp_c
+        self._d[i] = depth_mm
+        self._head = (i + 1) % self.MAX_READINGS
+        if self._count < self.MAX_READINGS:
+            self._count += 1
+    
+    def reading_count(self):
+        return self._count
+    
+    def _first_index(self):
+        """Ring index of the oldest reading."""
+        return self._head if self._count == self.MAX_READINGS else 0
+    
+    def _slice(self, buf, start, stop):
+        """
+        Return logical readings [start, stop) of a buffer, oldest-first.
+        A view when the range is contiguous in the ring; copies only if it wraps.
+        """
+        first = self._first_index()
+        a = (first + start) % self.MAX_READINGS
+        b = a + (stop - start)
+        if b <= self.MAX_READINGS:
+            return buf[a:b]
+        return np.concatenate((buf[a:], buf[:b - self.MAX_READINGS]))
     
-    def get_readings_since(self, since_timestamp=0):
-        """Return readings after a given timestamp (for live updates)."""
-        return [r for r in self.readings if r["t"] > since_timestamp]
+    def _rows(self, start, stop, step=1):
+        """Build JSON-ready reading dicts for logical positions range(start, stop, step)."""
+        # Round whole columns at once (in float64, so float32 noise rounds away)
+        t = self._slice(self._t, start, stop)[::step].tolist()
+        p = self._slice(self._p, start, stop)[::step].astype(np.float64).round(3).tolist()
+        temp = self._slice(self._temp, start, stop)[::step].astype(np.float64).round(2).tolist()
+        d = self._slice(self._d, start, stop)[::step].astype(np.float64).round(2).tolist()
+        return [
+            {"t": ti, "p": pi, "temp": tempi, "d": di}
+            for ti, pi, tempi, di in zip(t, p, temp, d)
+        ]
     
-    def elapsed_minutes(self):
+    def _index_after(self, timestamp):
+        """
+        Logical position of the first reading newer than timestamp.
+        Timestamps are sorted within each ring segment, so binary-search the
+        right segment in place instead of copying the ring into order.
+        """
+        first = self._first_index()
+        if first == 0:
+            return int(np.searchsorted(self._t[:self._count], timestamp, side="right"))
+        if timestamp < self._t[-1]:  # Falls in the older segment [first, N)
+            return int(np.searchsorted(self._t[first:], timestamp, side="right"))
+        older = self.MAX_READINGS - first
+        return older + int(np.searchsorted(self._t[:first], timestamp, side="right"))
+    
+    def get_readings_since(self, since_timestamp=0, limit=300):
+        """
+        Return readings after a given timestamp (for live updates).
+        If there are more than `limit` (e.g. a backgrounded tab catching up),
+        stride-sample them down instead of dropping the oldest, so the chart
+        keeps its shape without a gap. The newest reading is always included.
+        """
+        n = self._count
+        start = self._index_after(since_timestamp)
+        step = max(1, -(-(n - start) // limit))  # ceil, so at most `limit` rows
+        start += (n - 1 - start) % step  # Align so the stride ends on the newest
+        return self._rows(start, n, step)
+    
+    def elapsed_minutes(self, now=None):
         if not self.start_time:
             return 0
-        return (time.time() - self.start_time) / 60.0
+        return ((now or time.time()) - self.start_time) / 60.0
     
     def calculate_leak_rate(self):
         """
@@ -64,23 +142,30 @@ class TestSession:
         2. Subtract expected evaporation
         3. Return leak rate in mm/hr
         """
-        if len(self.readings) < 60:
+        n = self._count
+        if n < 60:
             return None
         
-        # Use rolling averages to smooth noise
-        window = 30  # 30-second windows
+        # Data only changes once per sample — reuse the result between polls
+        newest = float(self._t[self._head - 1])
+        cached_at, cached = self._leak_cache
+        if cached_at == newest:
+            return cached
         
-        # First 30 readings average (start depth)
-        start_depths = [r["d"] for r in list(self.readings)[:window]]
-        start_depth = statistics.mean(start_depths)
+        # Use window medians to smooth noise — unlike a mean, a median
+        # ignores the MS5837's occasional single-sample spikes
+        window = 30  # 30-second windows
+        start_depth = _median(self._slice(self._d, 0, window))   # First 30 readings
+        end_depth = _median(self._slice(self._d, n - window, n))  # Last 30 readings
         
-        # Last 30 readings average (end depth)
-        end_depths = [r["d"] for r in list(self.readings)[-window:]]
-        end_depth = statistics.mean(end_depths)
+        # Temperature drifts slowly — every 30th sample is plenty for the mean
+        # (ring order doesn't matter for an average). Accumulate in float64
+        # so long tests don't lose precision summing float32 samples.
+        avg_temp = float(self._temp[:n:30].mean(dtype=np.float64))
         
         # Time elapsed in hours
-        time_start = list(self.readings)[0]["t"]
-        time_end = list(self.readings)[-1]["t"]
+        time_start = float(self._t[self._first_index()])
+        time_end = newest
         elapsed_hrs = (time_end - time_start) / 3600.0
         
         if elapsed_hrs < 0.1:  # Need at least 6 minutes
@@ -91,7 +176,6 @@ class TestSession:
         
         # Expected evaporation
         # TODO: Pull from weather API for more accuracy
-        avg_temp = statistics.mean([r["temp"] for r in self.readings])
         evap_rate = self._estimate_evaporation(avg_temp)
         expected_evap_mm = evap_rate * elapsed_hrs
         
@@ -106,7 +190,7 @@ class TestSession:
         liters_per_mm = pool_surface_m2  # 1mm * 1m² = 1 liter
         gal_per_day = (leak_rate_mm_hr * 24 * liters_per_mm) / 3.785
         
-        return {
+        result = {
             "raw_loss_mm": round(raw_loss_mm, 2),
             "evap_correction_mm": round(expected_evap_mm, 2),
             "net_loss_mm": round(net_loss_mm, 2),
@@ -116,6 +200,8 @@ class TestSession:
             "avg_temp_c": round(avg_temp, 1),
             "verdict": self._get_verdict(leak_rate_mm_hr),
         }
+        self._leak_cache = (newest, result)
+        return result
     
     def _estimate_evaporation(self, water_temp_c):
         """
@@ -155,11 +241,13 @@ def sensor_thread():
     
     # Calibrate: take first reading as atmospheric baseline
     baseline_offset = None
+    next_deadline = time.monotonic()
     
     while True:
         timestamp = time.time()
         
-        if sensor and sensor.read():
+        # D2 converts during the sleep below, so each tick only waits on D1
+        if sensor and sensor.read_overlapped():
             pressure = sensor.pressure()
             temp = sensor.temperature()
             
@@ -179,7 +267,13 @@ def sensor_thread():
         if session.status in ("baseline", "testing"):
             session.add_reading(timestamp, pressure, temp, depth)
         
-        time.sleep(CONFIG["SAMPLE_INTERVAL_SEC"])
+        # Sleep to the next fixed deadline so read time doesn't add drift
+        next_deadline += CONFIG["SAMPLE_INTERVAL_SEC"]
+        delay = next_deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_deadline = time.monotonic()  # Fell behind — don't burst to catch up
 
 
 # ─── Web Dashboard ────────────────────────────────────────────────────
@@ -473,22 +567,29 @@ def api_data():
     new_readings = session.get_readings_since(since)
     latest = new_readings[-1] if new_readings else None
     
-    elapsed_min = session.elapsed_minutes()
-    elapsed_str = f"{int(elapsed_min)}:{int(elapsed_min % 1 * 60):02d}"
+    now = time.time()
+    elapsed_min = session.elapsed_minutes(now)
+    if session.status == "idle":
+        elapsed_str = "0:00"
+    else:
+        mins, secs = divmod(int(elapsed_min * 60), 60)
+        elapsed_str = f"{mins}:{secs:02d}"
     
     leak_rate = None
     if session.status == "testing" and elapsed_min > 2:
         leak_rate = session.calculate_leak_rate()
     
-    return jsonify({
+    # orjson is much faster than jsonify's json module for the readings list
+    payload = {
         "status": session.status,
         "elapsed": elapsed_str,
-        "total_readings": len(session.readings),
-        "new_readings": new_readings[-300:],  # Cap at 300 per update
+        "total_readings": session.reading_count(),
+        "new_readings": new_readings,  # At most 300 per update (stride-sampled)
         "latest": latest,
         "leak_rate": leak_rate,
         "result": session.result,
-    })
+    }
+    return Response(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), mimetype="application/json")
 
 @app.route("/api/start", methods=["POST"])
 def api_start():
@@ -518,13 +619,15 @@ def api_stop():
     filename = f"test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     filepath = os.path.join(CONFIG["DATA_DIR"], filename)
     
-    with open(filepath, "w") as f:
-        json.dump({
-            "result": session.result,
-            "readings_count": len(session.readings),
-            "start_time": session.start_time,
-            "end_time": time.time(),
-        }, f, indent=2)
+    # Compact orjson bytes in one write — quicker to flush to the Pi's SD card
+    data_bytes = orjson.dumps({
+        "result": session.result,
+        "readings_count": session.reading_count(),
+        "start_time": session.start_time,
+        "end_time": time.time(),
+    }, option=orjson.OPT_SERIALIZE_NUMPY)
+    with open(filepath, "wb") as f:
+        f.write(data_bytes)
     
     print(f"[PoolSense] Test saved to {filepath}")
     return jsonify({"ok": True, "result": session.result})
@@ -542,4 +645,4 @@ if __name__ == "__main__":
     t.start()
     
     # Start web server
-    app.run(host="0.0.0.0", port=CONFIG["WEB_PORT"], debug=False)
+    serve(app, host="0.0.0.0", port=CONFIG["WEB_PORT"], threads=4)
@@ -23,7 +23,8 @@ echo "dtoverlay=w1-gpio" | sudo tee -a /boot/config.txt
 
 # Install Python packages
 echo "[4/6] Installing Python packages..."
-pip3 install flask smbus2 requests --break-system-packages
+pip3 install flask waitress smbus2 numpy orjson requests --break-system-packages
+pip3 install numba --break-system-packages || echo "  numba unavailable — sensor math will run in pure Python"
 
 # Clone PoolSense repo
 echo "[5/6] Downloading PoolSense..."